@@ -3,14 +3,16 @@ import operator
 from contract_manager import ContractManager
 from .comparer_utils import *
 from .diff_utils import SimilarFinder
+from .fingerprint_utils import FingerprintIndex, print_contained
 
 
 class Comparer:
-    def __init__(self, manager: ContractManager, no_operands: bool = False, diff_percentage: int = 0, verbose: bool = False):
+    def __init__(self, manager: ContractManager, no_operands: bool = False, diff_percentage: int = 0, verbose: bool = False, top_k: int = 0):
         self.manager = manager
         self.no_operands = no_operands
         self.diff_percentage = diff_percentage
         self.verbose = verbose
+        self.top_k = top_k
 
     def __enter__(self):
         return self
@@ -20,43 +22,62 @@ class Comparer:
 
     def compare(self, contract_addresses: list[str]) -> None:
         # {address -> [{signature, function_assembly}]}
-        funcs_dict = {}
-        assembly_dict = {}
-        address_to_line_dict = {}
+        funcs_dict = {address: self.get_functions(address) for address in set(contract_addresses)}
+        prepared = {}
 
-        for address in set(contract_addresses):
-            # plan:
+        for i in range(1, len(contract_addresses)):
+            for j in range(i):
+                addresses = [contract_addresses[i], contract_addresses[j]]
+                f_data = [funcs_dict[addresses[0]], funcs_dict[addresses[1]]]
+                self.compare_pair(addresses, f_data, prepared=prepared)
 
-            abi = self.manager.get_abi(address)
-            assembly = self.manager.get_assembly(address)
-            address_to_line = {instruction.pc: i for i, instruction in enumerate(assembly)}
+    def find_contained(self, contract_addresses: list[str], min_containment: float) -> None:
+        index = FingerprintIndex(self.no_operands)
+        for address in dict.fromkeys(contract_addresses):
+            index.add(address, self.get_functions(address))
 
-            assembly_dict[address] = assembly
-            address_to_line_dict[address] = address_to_line
+        for address in index.fingerprints:
+            print_contained(address, index.find_contained(address, min_containment))
 
-            # 1. get all functions hash codes from abi
-            signatures, method_ids = get_functions_info(abi)
+    def compare_pair(self, addresses: list[str], f_data: list[list[dict]], quiet: bool = False, prepared: dict = None) -> dict:
+        finder = SimilarFinder(
+            f_data,
+            addresses,
+            self.no_operands,
+            self.diff_percentage,
+            quiet,
+            prepared,
+        )
+        if self.top_k > 0:
+            return {
+                'addresses': addresses,
+                'signatures': finder.signature,
+                'best_matches': finder.find_best_matches(self.top_k),
+            }
+        return {
+            'addresses': addresses,
+            'similar': finder.find_similar(),
+        }
 
-            # 2. find occurrences in assembly file and find corresponding position of JUMPDEST in code
-            functions_jumpdests = find_jumpdests_of_functions(assembly, address_to_line, method_ids)
-            funcs_data = list(zip(functions_jumpdests, signatures, method_ids))
+    def get_functions(self, address: str) -> list[dict]:
+        # plan:
 
-            fallback_jumpdest = find_fallback_jumpdest(assembly, address_to_line)
-            if fallback_jumpdest is not None:
-                funcs_data.append((fallback_jumpdest, 'fallback()', None))
+        abi = self.manager.get_abi(address)
+        assembly = self.manager.get_assembly(address)
+        address_to_line = {instruction.pc: i for i, instruction in enumerate(assembly)}
 
-            funcs_data.sort(key=operator.itemgetter(0))
+        # 1. get all functions hash codes from abi
+        signatures, method_ids = get_functions_info(abi)
 
-            # 3. make a dict contract_address -> [{signature, start}]
-            funcs_dict[address] = obtain_funcs_dict(assembly, address_to_line, funcs_data, self.verbose)
+        # 2. find occurrences in assembly file and find corresponding position of JUMPDEST in code
+        functions_jumpdests = find_jumpdests_of_functions(assembly, address_to_line, method_ids)
+        funcs_data = list(zip(functions_jumpdests, signatures, method_ids))
 
-        for i in range(1, len(contract_addresses)):
-            for j in range(i):
-                addresses = [contract_addresses[i], contract_addresses[j]]
-                f_data = [funcs_dict[addresses[0]], funcs_dict[addresses[1]]]
-                SimilarFinder(
-                    f_data,
-                    addresses,
-                    self.no_operands,
-                    self.diff_percentage,
-                ).find_similar()
+        fallback_jumpdest = find_fallback_jumpdest(assembly, address_to_line)
+        if fallback_jumpdest is not None:
+            funcs_data.append((fallback_jumpdest, 'fallback()', None))
+
+        funcs_data.sort(key=operator.itemgetter(0))
+
+        # 3. make a list [{signature, start}] for the contract
+        return obtain_funcs_dict(assembly, address_to_line, funcs_data, self.verbose)
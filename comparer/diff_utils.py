@@ -1,3 +1,6 @@
+import heapq
+import math
+from collections import Counter
 from difflib import context_diff
 from pyevmasm import Instruction
 
@@ -8,7 +11,9 @@ class SimilarFinder:
         f_data,
         addresses,
         no_operands: bool = False,
-        diff_percentage: int = 0
+        diff_percentage: int = 0,
+        quiet: bool = False,
+        prepared: dict = None,
     ):
         self.functions_unwrapped_assembly = [
             [k['unwrapped_assembly'] for k in f_data[0]],
@@ -23,11 +28,14 @@ class SimilarFinder:
         self.address = addresses
         self.no_operands = no_operands
         self.diff_percentage = diff_percentage
+        self.quiet = quiet
+
+        # {(address, i, no_operands) -> (prepared assembly, Counter of its elements)},
+        # may be shared between finders, so the functions are prepared only once
+        self._prepared = prepared if prepared is not None else {}
     
     def is_significant_diff(self, diff) -> bool:
-        (len_diff, len1, len2) = diff
-        percentage = len_diff / max(len1, len2) * 100.0
-        return percentage > self.diff_percentage
+        return _get_diff_percentage(*diff) > self.diff_percentage
 
     def find_similar(self) -> list[(str, str)]:
         similar = []
@@ -38,27 +46,108 @@ class SimilarFinder:
                 if (self.signature[0][i0], self.signature[1][i1]) in used:
                     continue
 
-                if not self.is_significant_diff(self._find_diff(i0, i1, self.no_operands)):
+                if self._get_diff_lower_bound(i0, i1, self.no_operands) > self.diff_percentage:
+                    is_similar = False
+                else:
+                    is_similar = not self.is_significant_diff(self._find_diff(i0, i1, self.no_operands))
+
+                if is_similar:
                     similar.append((self.signature[0][i0], self.signature[1][i1]))
                     used.add((self.signature[0][i0], self.signature[1][i1]))
-                    print('Found similar functions in contracts:')
-                    print(f"\t{self.address[0]}: {self.signature[0][i0]}")
-                    print(f"\t{self.address[1]}: {self.signature[1][i1]}")
-                    print()
+                    if not self.quiet:
+                        print_similar(self.address, self.signature[0][i0], self.signature[1][i1])
 
                 for m in range(2):
                     used.add((self.signature[0][i0], self.signature[1][i1]))
 
         return similar
     
-    def _find_diff(self, id0: int, id1: int, no_operands: bool = False) -> list[str]:
-        f0_operators = self._prepare_assembly(0, id0, no_operands)
-        f1_operators = self._prepare_assembly(1, id1, no_operands)
+    def find_best_matches(self, k: int = 1) -> list[list[list[(str, float)]]]:
+        """
+        Ranks the functions of each contract by their diff with the functions of the other contract.
+        Candidates are visited in the order of a cheap lower bound of their diff, and once the k best matches
+        of a function are found, candidates whose bound can't beat them are skipped without a full diff
+        :param k: The number of best matches to keep per function
+        :return: For every contract and every its function, the list of (signature, diff percentage) sorted by diff
+        """
+        if k < 1:
+            raise ValueError('k must be positive')
+
+        # heaps[m][i] contains (-diff_percentage, -other_id, other_signature), so the worst match is on top
+        heaps = [
+            [[] for _ in self.functions_unwrapped_assembly[0]],
+            [[] for _ in self.functions_unwrapped_assembly[1]],
+        ]
+
+        def cutoff(heap) -> float:
+            return -heap[0][0] if len(heap) == k else math.inf
+
+        def push(heap, percentage, other_id, other_signature):
+            item = (-percentage, -other_id, other_signature)
+            if len(heap) < k:
+                heapq.heappush(heap, item)
+            elif item[:2] > heap[0][:2]:
+                # better score, or the same score and a smaller id
+                heapq.heapreplace(heap, item)
+
+        candidates = sorted(
+            (self._get_diff_lower_bound(i0, i1, self.no_operands), i0, i1)
+            for i0 in range(len(self.functions_unwrapped_assembly[0]))
+            for i1 in range(len(self.functions_unwrapped_assembly[1]))
+        )
+
+        for (bound, i0, i1) in candidates:
+            # a candidate is worth a full diff only if it may get into at least one of the heaps
+            if bound > max(cutoff(heaps[0][i0]), cutoff(heaps[1][i1])):
+                continue
+
+            percentage = _get_diff_percentage(*self._find_diff(i0, i1, self.no_operands))
+            push(heaps[0][i0], percentage, i1, self.signature[1][i1])
+            push(heaps[1][i1], percentage, i0, self.signature[0][i0])
+
+        best_matches = [
+            [[(signature, -neg_percentage) for (neg_percentage, _, signature) in sorted(heap, reverse=True)] for heap in heaps[m]]
+            for m in range(2)
+        ]
+
+        if not self.quiet:
+            print_best_matches(self.address, self.signature, best_matches)
+
+        return best_matches
+
+    def _find_diff(self, id0: int, id1: int, no_operands: bool = False) -> (int, int, int):
+        (f0_operators, _) = self._get_prepared(0, id0, no_operands)
+        (f1_operators, _) = self._get_prepared(1, id1, no_operands)
+
+        if f0_operators == f1_operators:
+            return (0, len(f0_operators), len(f1_operators))
 
         diff = list(context_diff(f0_operators, f1_operators))
 
         return (len(diff), len(f0_operators), len(f1_operators))
 
+    def _get_diff_lower_bound(self, id0: int, id1: int, no_operands: bool = False) -> float:
+        # the lower bound of the diff percentage, which doesn't need to match the sequences
+        (f0_operators, f0_counter) = self._get_prepared(0, id0, no_operands)
+        (f1_operators, f1_counter) = self._get_prepared(1, id1, no_operands)
+        len0 = len(f0_operators)
+        len1 = len(f1_operators)
+
+        if f0_operators == f1_operators:
+            return 0.0
+
+        # a non-empty diff has 2 file header lines and 3 hunk header lines,
+        # and every element out of the common multiset is at least one more line
+        common = sum((f0_counter & f1_counter).values())
+        return _get_diff_percentage(5 + len0 + len1 - 2 * common, len0, len1)
+
+    def _get_prepared(self, id, i, no_operands: bool = False) -> (str, Counter):
+        key = (self.address[id], i, no_operands)
+        if key not in self._prepared:
+            operators = self._prepare_assembly(id, i, no_operands)
+            self._prepared[key] = (operators, Counter(operators))
+        return self._prepared[key]
+
     # id is 0 or 1
     def _prepare_assembly(self, id, i, no_operands: bool = False) -> str:
         def collect(to_string):
@@ -67,3 +156,28 @@ class SimilarFinder:
         if no_operands:
             return collect(lambda x: str(x.name))
         return collect(lambda x: str(x))
+
+
+def print_similar(addresses: list[str], signature0: str, signature1: str) -> None:
+    print('Found similar functions in contracts:')
+    print(f"\t{addresses[0]}: {signature0}")
+    print(f"\t{addresses[1]}: {signature1}")
+    print()
+
+
+def print_best_matches(addresses: list[str], signatures: list[list[str]], best_matches: list[list[list[(str, float)]]]) -> None:
+    for m in range(2):
+        for i, matches in enumerate(best_matches[m]):
+            if not matches:
+                continue
+            print('Best matches for function in contract:')
+            print(f"\t{addresses[m]}: {signatures[m][i]}")
+            for (signature, percentage) in matches:
+                print(f"\t\t{addresses[1 - m]}: {signature} ({percentage:.2f}% diff)")
+            print()
+
+
+def _get_diff_percentage(len_diff: int, len1: int, len2: int) -> float:
+    if len_diff == 0:
+        return 0.0
+    return len_diff / max(len1, len2) * 100.0
@@ -0,0 +1,266 @@
+from hashlib import blake2b
+from pyevmasm import Instruction
+
+
+# a common region of at least KGRAM_SIZE + WINDOW_SIZE - 1 instructions is always detected
+KGRAM_SIZE = 6
+WINDOW_SIZE = 6
+# functions with fewer fingerprints are too short to be matched reliably
+MIN_FINGERPRINTS = 4
+# how far the matched fingerprints of one region may drift apart due to inserted or removed instructions
+MAX_SHIFT = 8
+# fingerprints found in more functions are boilerplate, such as dispatcher prologues, and are not indexed
+MAX_FREQUENCY = 50
+
+
+def get_kgram_hashes(assembly: list[Instruction], no_operands: bool = False, k: int = KGRAM_SIZE) -> list[int]:
+    """
+    Calculates hashes of all the k-grams of instructions
+    :param assembly: The instructions
+    :param no_operands: Whether to ignore the operands
+    :param k: The number of instructions in a k-gram
+    :return: The hash of every k-gram, indexed by its first instruction
+    """
+    tokens = [instr.name if no_operands else str(instr) for instr in assembly]
+
+    hashes = []
+    for i in range(len(tokens) - k + 1):
+        data = '\n'.join(tokens[i:i + k]).encode('ascii')
+        hashes.append(int.from_bytes(blake2b(data, digest_size=8).digest(), 'big'))
+    return hashes
+
+
+def winnow(hashes: list[int], window: int = WINDOW_SIZE) -> list[(int, int)]:
+    """
+    Selects fingerprints from the hashes: the minimal hash of every window, the rightmost one on ties
+    :param hashes: The k-gram hashes
+    :param window: The number of consecutive hashes in a window
+    :return: The list of (hash, offset), ordered by offset
+    """
+    if len(hashes) < window:
+        # too short for a full window, the minimal hash still represents the function
+        if not hashes:
+            return []
+        offset = min(range(len(hashes)), key=lambda i: (hashes[i], -i))
+        return [(hashes[offset], offset)]
+
+    fingerprints = []
+    last = -1
+    for start in range(len(hashes) - window + 1):
+        offset = min(range(start, start + window), key=lambda i: (hashes[i], -i))
+        if offset != last:
+            fingerprints.append((hashes[offset], offset))
+            last = offset
+    return fingerprints
+
+
+def get_fingerprints(
+    assembly: list[Instruction],
+    no_operands: bool = False,
+    k: int = KGRAM_SIZE,
+    window: int = WINDOW_SIZE,
+) -> list[(int, int)]:
+    return winnow(get_kgram_hashes(assembly, no_operands, k), window)
+
+
+class FingerprintIndex:
+    """
+    Posting index hash -> [(address, signature, offset)] over winnowed fingerprints of unwrapped functions.
+    Answers which indexed functions contain a given function by looking up only its own fingerprints.
+    Hashes found in more than max_frequency functions are stop-listed, so every posting list stays short
+    """
+
+    def __init__(
+        self,
+        no_operands: bool = False,
+        k: int = KGRAM_SIZE,
+        window: int = WINDOW_SIZE,
+        min_fingerprints: int = MIN_FINGERPRINTS,
+        max_shift: int = MAX_SHIFT,
+        max_frequency: int = MAX_FREQUENCY,
+    ):
+        self.no_operands = no_operands
+        self.k = k
+        self.window = window
+        self.min_fingerprints = min_fingerprints
+        self.max_shift = max_shift
+        self.max_frequency = max_frequency
+        # {hash -> [(address, signature, offset)]}, without the stop-listed hashes
+        self.postings = {}
+        # {hash -> number of functions with the hash}
+        self.frequency = {}
+        self.stop_list = set()
+        # {address -> [{signature, fingerprints}]}
+        self.fingerprints = {}
+
+    def add(self, address: str, funcs: list[dict]) -> None:
+        """
+        Indexes the functions of a contract. Does nothing if the contract is already indexed
+        :param address: The address of the contract
+        :param funcs: The functions as returned by Comparer.get_functions
+        :return: None
+        """
+        self.insert(address, self.compute(funcs))
+
+    def compute(self, funcs: list[dict]) -> list[dict]:
+        """
+        Calculates fingerprints of the functions without touching the index
+        :param funcs: The functions as returned by Comparer.get_functions
+        :return: The list of {signature, fingerprints}
+        """
+        return [
+            {'signature': func['signature'], 'fingerprints': self.get_fingerprints(func['unwrapped_assembly'])}
+            for func in funcs
+        ]
+
+    def insert(self, address: str, fingerprinted: list[dict]) -> None:
+        """
+        Adds the fingerprints of a contract's functions to the index. Does nothing if the contract is already indexed
+        :param address: The address of the contract
+        :param fingerprinted: The functions as returned by compute
+        :return: None
+        """
+        if address in self.fingerprints:
+            return
+
+        self.fingerprints[address] = fingerprinted
+        for func in fingerprinted:
+            for h in set(h for (h, _) in func['fingerprints']):
+                self.frequency[h] = self.frequency.get(h, 0) + 1
+                if self.frequency[h] > self.max_frequency and h not in self.stop_list:
+                    self.stop_list.add(h)
+                    self.postings.pop(h, None)
+
+            for (h, offset) in func['fingerprints']:
+                if h not in self.stop_list:
+                    self.postings.setdefault(h, []).append((address, func['signature'], offset))
+
+    def get_fingerprints(self, assembly: list[Instruction]) -> list[(int, int)]:
+        return get_fingerprints(assembly, self.no_operands, self.k, self.window)
+
+    def find_containing(self, fingerprints: list[(int, int)], min_containment: float = 0.0, exclude_address: str = None) -> list[dict]:
+        """
+        Finds the indexed functions which contain the function with the given fingerprints.
+        Matches are grouped by the shift between the offsets in the indexed and the given function,
+        and only the densest group, which is the embedded region, is scored
+        :param fingerprints: The fingerprints of the function
+        :param min_containment: The minimal share of the fingerprints found in the region, in percents
+        :param exclude_address: The contract to skip, usually the one of the function itself
+        :return: The list of {address, signature, containment, shared, total, start, end} sorted by containment,
+            where shared of total fingerprints are found in the region [start, end) of the unwrapped function.
+            The region may start up to WINDOW_SIZE - 1 instructions later and end as much earlier.
+            Stop-listed fingerprints are not counted, and functions with fewer than min_fingerprints
+            remaining fingerprints are never matched
+        """
+        return self.score(*self.lookup(fingerprints), min_containment, exclude_address)
+
+    def lookup(self, fingerprints: list[(int, int)]) -> (list[(int, int)], dict):
+        """
+        Copies everything find_containing needs from the index, so the scoring may run while the index changes
+        :param fingerprints: The fingerprints of the function
+        :return: The fingerprints without the stop-listed ones, and their posting lists
+        """
+        fingerprints = [(h, offset) for (h, offset) in fingerprints if h not in self.stop_list]
+        return fingerprints, {h: list(self.postings.get(h, [])) for (h, _) in fingerprints}
+
+    def score(self, fingerprints: list[(int, int)], postings: dict, min_containment: float = 0.0, exclude_address: str = None) -> list[dict]:
+        """
+        Scores the matches of a function found by lookup, see find_containing
+        :param fingerprints: The fingerprints returned by lookup
+        :param postings: The posting lists returned by lookup
+        :param min_containment: The minimal share of the fingerprints found in the region, in percents
+        :param exclude_address: The contract to skip, usually the one of the function itself
+        :return: The list of {address, signature, containment, shared, total, start, end} sorted by containment
+        """
+        total = len(fingerprints)
+        if total < self.min_fingerprints:
+            return []
+
+        # {(address, signature) -> [(shift, query offset, offset)]}
+        candidates = {}
+        for (h, query_offset) in fingerprints:
+            for (address, signature, offset) in postings[h]:
+                if address == exclude_address:
+                    continue
+                candidates.setdefault((address, signature), []).append((offset - query_offset, query_offset, offset))
+
+        results = []
+        for ((address, signature), matches) in candidates.items():
+            region = self._find_densest_region(matches)
+            shared = len(set(query_offset for (_, query_offset, _) in region))
+            containment = shared / total * 100.0
+            if containment >= min_containment:
+                results.append({
+                    'address': address,
+                    'signature': signature,
+                    'containment': containment,
+                    'shared': shared,
+                    'total': total,
+                    'start': min(offset for (_, _, offset) in region),
+                    'end': max(offset for (_, _, offset) in region) + self.k,
+                })
+
+        results.sort(key=lambda result: -result['containment'])
+        return results
+
+    def find_contained(self, address: str, min_containment: float = 0.0) -> list[dict]:
+        """
+        Finds the functions of other indexed contracts which contain functions of the contract
+        :param address: The address of the indexed contract
+        :param min_containment: The minimal share of the fingerprints found in a function, in percents
+        :return: The list of {signature, containing} for every function of the contract with at least one match
+        """
+        return self.score_contained(self.lookup_contained(address), min_containment, address)
+
+    def lookup_contained(self, address: str) -> list[(str, list[(int, int)], dict)]:
+        """
+        Copies everything find_contained needs from the index, so the scoring may run while the index changes
+        :param address: The address of the indexed contract
+        :return: The list of (signature, fingerprints, postings) as returned by lookup for every function
+        """
+        return [(func['signature'], *self.lookup(func['fingerprints'])) for func in self.fingerprints[address]]
+
+    def score_contained(self, queries: list[(str, list[(int, int)], dict)], min_containment: float, address: str) -> list[dict]:
+        """
+        Scores the matches of a contract's functions found by lookup_contained, see find_contained
+        :param queries: The result of lookup_contained
+        :param min_containment: The minimal share of the fingerprints found in a function, in percents
+        :param address: The address of the contract
+        :return: The list of {signature, containing} for every function of the contract with at least one match
+        """
+        results = []
+        for (signature, fingerprints, postings) in queries:
+            containing = self.score(fingerprints, postings, min_containment, exclude_address=address)
+            if containing:
+                results.append({'signature': signature, 'containing': containing})
+        return results
+
+    def _find_densest_region(self, matches: list[(int, int, int)]) -> list[(int, int, int)]:
+        # the group of matches with shifts within max_shift of each other covering the most query fingerprints
+        matches.sort()
+        best = (0, 0, 0)
+        # {query offset -> count in the current group}
+        counts = {}
+        lo = 0
+        for hi, (shift, query_offset, _) in enumerate(matches):
+            counts[query_offset] = counts.get(query_offset, 0) + 1
+            while shift - matches[lo][0] > self.max_shift:
+                lo_offset = matches[lo][1]
+                counts[lo_offset] -= 1
+                if counts[lo_offset] == 0:
+                    del counts[lo_offset]
+                lo += 1
+            if len(counts) > best[0]:
+                best = (len(counts), lo, hi + 1)
+        return matches[best[1]:best[2]]
+
+
+def print_contained(address: str, contained: list[dict]) -> None:
+    for func in contained:
+        print('Found function contained in functions:')
+        print(f"\t{address}: {func['signature']}")
+        for match in func['containing']:
+            print(f"\t\t{match['address']}: {match['signature']} "
+                  + f"({match['containment']:.2f}% contained, {match['shared']}/{match['total']} fingerprints, "
+                  + f"instructions {match['start']}-{match['end']})")
+        print()
@@ -0,0 +1,2 @@
+from .analysis_index import AnalysisIndex
+from .http_server import AnalysisServer
@@ -0,0 +1,145 @@
+import threading
+from concurrent.futures import Future
+
+from comparer import Comparer
+from comparer.fingerprint_utils import FingerprintIndex
+
+
+class AnalysisIndex:
+    def __init__(self, comparer: Comparer):
+        """
+        :param comparer: The comparer used to extract functions and to hold the comparison settings
+        """
+        self.comparer = comparer
+        # {address -> [{signature, unwrapped_assembly}]}
+        self._funcs = {}
+        self._fingerprints = FingerprintIndex(comparer.no_operands)
+        # {(address, function id, no_operands) -> (prepared assembly, Counter)}, shared by all the comparisons
+        self._prepared = {}
+        # {address -> Future}, extractions which are currently in progress
+        self._pending = {}
+        # {(address0, address1, no_operands, diff_percentage, top_k) -> Future}, results of pair comparisons,
+        # so concurrent and repeated requests for the same pair share a single comparison
+        self._pair_results = {}
+        self._lock = threading.Lock()
+
+    def addresses(self) -> list[str]:
+        """
+        Gets the addresses of all the ingested contracts
+        :return: The addresses in the order of ingestion
+        """
+        with self._lock:
+            return list(self._funcs)
+
+    def ingest(self, addresses: list[str]) -> list[str]:
+        """
+        Extracts functions of the contracts, which are not in the index yet.
+        Concurrent requests for the same contract wait for a single extraction
+        :param addresses: The addresses of the contracts
+        :return: The addresses ingested by this call
+        """
+        futures = []
+        owned = []
+
+        with self._lock:
+            for address in dict.fromkeys(addresses):
+                if address in self._funcs:
+                    continue
+                future = self._pending.get(address)
+                if future is None:
+                    future = Future()
+                    self._pending[address] = future
+                    owned.append((address, future))
+                futures.append(future)
+
+        for address, future in owned:
+            try:
+                funcs = self.comparer.get_functions(address)
+                fingerprinted = self._fingerprints.compute(funcs)
+            except Exception as e:
+                with self._lock:
+                    del self._pending[address]
+                future.set_exception(e)
+                continue
+
+            with self._lock:
+                self._funcs[address] = funcs
+                self._fingerprints.insert(address, fingerprinted)
+                del self._pending[address]
+            future.set_result(funcs)
+
+        for future in futures:
+            future.result()
+
+        return [address for address, _ in owned]
+
+    def compare(self, addresses: list[str]) -> list[dict]:
+        """
+        Finds similar functions in every pair of the contracts
+        :param addresses: The addresses of the contracts
+        :return: The list of {addresses, similar} for every pair of contracts, or {addresses, signatures, best_matches} if top_k is set
+        """
+        self.ingest(addresses)
+        addresses = list(dict.fromkeys(addresses))
+
+        results = []
+        for i in range(1, len(addresses)):
+            for j in range(i):
+                results.append(self._compare_pair(addresses[i], addresses[j]))
+        return results
+
+    def similar_to(self, address: str) -> list[dict]:
+        """
+        Finds similar functions of the contract in all the other ingested contracts
+        :param address: The address of the contract
+        :return: The list of {addresses, similar} for every pair with at least one similar function,
+            or {addresses, signatures, best_matches} for every pair if top_k is set
+        """
+        self.ingest([address])
+
+        results = []
+        for other in self.addresses():
+            if other == address:
+                continue
+            result = self._compare_pair(address, other)
+            if 'best_matches' in result or result['similar']:
+                results.append(result)
+        return results
+
+    def contained_in(self, address: str, min_containment: float = 0.0) -> list[dict]:
+        """
+        Finds the functions of all the other ingested contracts, which contain functions of the contract
+        :param address: The address of the contract
+        :param min_containment: The minimal share of the fingerprints found in a function, in percents
+        :return: The list of {signature, containing} for every function of the contract with at least one match
+        """
+        self.ingest([address])
+
+        with self._lock:
+            queries = self._fingerprints.lookup_contained(address)
+
+        return self._fingerprints.score_contained(queries, min_containment, address)
+
+    def _compare_pair(self, address0: str, address1: str) -> dict:
+        comparer = self.comparer
+        key = (address0, address1, comparer.no_operands, comparer.diff_percentage, comparer.top_k)
+
+        with self._lock:
+            future = self._pair_results.get(key)
+            is_owner = future is None
+            if is_owner:
+                future = Future()
+                self._pair_results[key] = future
+                f_data = [self._funcs[address0], self._funcs[address1]]
+
+        if is_owner:
+            try:
+                result = comparer.compare_pair([address0, address1], f_data, quiet=True, prepared=self._prepared)
+            except Exception as e:
+                with self._lock:
+                    del self._pair_results[key]
+                future.set_exception(e)
+                raise
+            future.set_result(result)
+
+        return future.result()
@@ -0,0 +1,99 @@
+import json
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from .analysis_index import AnalysisIndex
+
+
+class AnalysisServer(ThreadingHTTPServer):
+    """
+    Local HTTP/JSON server over a warm analysis index.
+
+    Endpoints:
+        GET  /contracts                             -> {"addresses": [...]}
+        POST /ingest     {"addresses": [...]}       -> {"ingested": [...]}
+        POST /compare    {"addresses": [...]}       -> {"results": [{"addresses", "similar"}]}
+        POST /similar-to {"address": "0x..."}       -> {"results": [{"addresses", "similar"}]}
+        POST /contained-in {"address": "0x...", "min_containment": 50}
+                                                    -> {"results": [{"signature", "containing"}]}
+
+    With top_k set in the comparer, results of /compare and /similar-to hold "signatures" and "best_matches"
+    instead of "similar", in the format of Comparer.compare_pair.
+    """
+    daemon_threads = True
+
+    def __init__(self, index: AnalysisIndex, host: str = '127.0.0.1', port: int = 8000):
+        """
+        :param index: The index to serve requests from
+        :param host: The host to bind to, defaults to localhost
+        :param port: The port to bind to, 0 picks a free port
+        """
+        self.index = index
+        super().__init__((host, port), _RequestHandler)
+
+
+class _RequestHandler(BaseHTTPRequestHandler):
+    server: AnalysisServer
+
+    def do_GET(self) -> None:
+        if self.path == '/contracts':
+            self._send_json(HTTPStatus.OK, {'addresses': self.server.index.addresses()})
+        else:
+            self._send_error(HTTPStatus.NOT_FOUND, f'Unknown path: {self.path}')
+
+    def do_POST(self) -> None:
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_error(HTTPStatus.BAD_REQUEST, 'Invalid JSON')
+            return
+
+        index = self.server.index
+        match self.path:
+            case '/ingest':
+                action = lambda: {'ingested': index.ingest(request['addresses'])}
+                is_valid = _has_addresses(request)
+            case '/compare':
+                action = lambda: {'results': index.compare(request['addresses'])}
+                is_valid = _has_addresses(request)
+            case '/similar-to':
+                action = lambda: {'results': index.similar_to(request['address'])}
+                is_valid = isinstance(request, dict) and isinstance(request.get('address'), str)
+            case '/contained-in':
+                action = lambda: {'results': index.contained_in(request['address'], request.get('min_containment', 0.0))}
+                is_valid = isinstance(request, dict) and isinstance(request.get('address'), str) \
+                    and isinstance(request.get('min_containment', 0.0), (int, float))
+            case _:
+                self._send_error(HTTPStatus.NOT_FOUND, f'Unknown path: {self.path}')
+                return
+
+        if not is_valid:
+            self._send_error(HTTPStatus.BAD_REQUEST, f'Invalid request body for {self.path}')
+            return
+
+        try:
+            response = action()
+        except Exception as e:
+            self._send_error(HTTPStatus.INTERNAL_SERVER_ERROR, str(e))
+            return
+
+        self._send_json(HTTPStatus.OK, response)
+
+    def _send_error(self, status: HTTPStatus, message: str) -> None:
+        self._send_json(status, {'error': message})
+
+    def _send_json(self, status: HTTPStatus, body: dict) -> None:
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def _has_addresses(request) -> bool:
+    if not isinstance(request, dict):
+        return False
+    addresses = request.get('addresses')
+    return isinstance(addresses, list) and all(isinstance(address, str) for address in addresses)
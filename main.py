@@ -6,6 +6,8 @@ from dotenv import load_dotenv
 from contract_manager import ContractManager
 from contract_manager.downloader import ContractDownloader
 from comparer import Comparer
+from daemon import AnalysisIndex, AnalysisServer
+from sharding import ShardQueue, run_coordinator, run_worker, print_results
 
 
 def main():
@@ -32,12 +34,45 @@ def main():
     parser.add_argument('-d', '--diff-percentage', metavar='DIFF_PERCENTAGE', type=int,
                         choices=range(0, 100), default=0, required=False,
                         help='Upperbound for diff of the similar functions.')
+    parser.add_argument('-k', '--top-k', metavar='K', type=int, default=0,
+                        required=False,
+                        help='Instead of the similar functions, report K best matches for each function with their diff percentage.')
+    parser.add_argument('-C', '--containment', metavar='CONTAINMENT', type=int,
+                        choices=range(1, 101), required=False,
+                        help='Instead of the similar functions, report functions contained in functions of other contracts '
+                        + 'by at least CONTAINMENT percent of their fingerprints.')
     parser.add_argument('-v', '--verbose', action='store_true',
                         required=False,
                         help='Print to the console all the debug info.')
+    parser.add_argument('-s', '--serve', action='store_true',
+                        required=False,
+                        help='Run as a daemon, which keeps the extracted functions in memory and serves HTTP/JSON requests. '
+                        + 'Specified contracts are ingested on startup.')
+    parser.add_argument('--host', metavar='HOST', default='127.0.0.1',
+                        required=False,
+                        help='Host for the daemon to bind to.')
+    parser.add_argument('--port', metavar='PORT', type=int, default=8000,
+                        required=False,
+                        help='Port for the daemon to listen on.')
+    parser.add_argument('-q', '--queue', metavar='PATH',
+                        required=False,
+                        help='Path to the shard queue database on a filesystem shared by the machines, e.g. contracts/queue.sqlite. '
+                        + 'Used with --coordinator or --worker.')
+    parser.add_argument('--coordinator', action='store_true',
+                        required=False,
+                        help='Split the comparison of the contracts into shards, wait for the workers and print the merged results.')
+    parser.add_argument('--worker', action='store_true',
+                        required=False,
+                        help='Process shards from the queue until the comparison is finished.')
+    parser.add_argument('--block-size', metavar='BLOCK_SIZE', type=int, default=16,
+                        required=False,
+                        help='Number of contracts in a block. A shard compares the contracts of two blocks.')
 
     args = parser.parse_args()
 
+    if (args.coordinator or args.worker) and args.queue is None:
+        parser.error('--queue must be specified for --coordinator and --worker')
+
     contracts_addresses = []
     if args.contracts_path is not None:
         with open(args.contracts_path, 'r') as file:
@@ -49,15 +84,45 @@ def main():
     if args.contracts is not None:
         contracts_addresses += args.contracts
     
-    if len(contracts_addresses) < 2:
+    if len(contracts_addresses) < 2 and not args.serve and not args.worker:
         print('Specify contracts to check either using addresses explicitly, or using a file with addresses. Check --help for usage info.')
     
     no_operands = args.no_operands
     verbose = args.verbose
     diff_percentage = args.diff_percentage
+    top_k = args.top_k
+
+    with Comparer(ContractManager(ContractDownloader(etherscan_api_key, node_url)), no_operands, diff_percentage, verbose, top_k) as comparer:
+        if args.serve:
+            serve(comparer, contracts_addresses, args.host, args.port)
+        elif args.coordinator:
+            coordinate(comparer, contracts_addresses, args.queue, args.block_size)
+        elif args.worker:
+            with ShardQueue(args.queue) as queue:
+                run_worker(queue, comparer)
+        elif args.containment is not None:
+            comparer.find_contained(contracts_addresses, args.containment)
+        else:
+            comparer.compare(contracts_addresses)
+
+
+def serve(comparer: Comparer, contracts_addresses: list[str], host: str, port: int):
+    index = AnalysisIndex(comparer)
+    index.ingest(contracts_addresses)
+
+    with AnalysisServer(index, host, port) as server:
+        print(f'Serving on http://{server.server_address[0]}:{server.server_address[1]}')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+
 
-    with Comparer(ContractManager(ContractDownloader(etherscan_api_key, node_url)), no_operands, diff_percentage, verbose) as comparer:
-        comparer.compare(contracts_addresses)
+def coordinate(comparer: Comparer, contracts_addresses: list[str], queue_path: str, block_size: int):
+    with ShardQueue(queue_path) as queue:
+        print_results(run_coordinator(queue, comparer, contracts_addresses, block_size))
+        for (shard_id, error) in queue.get_failed():
+            print(f'Shard {shard_id} failed: {error}', file=sys.stderr)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,4 @@
+from .shard_queue import ShardQueue
+from .shard_queue_exception import ShardQueueException
+from .shard_utils import get_pairs, split_into_shards, print_results
+from .shard_worker import run_coordinator, run_worker
@@ -0,0 +1,227 @@
+import json
+import sqlite3
+import time
+
+from utils.file_utils import make_dirs
+from .shard_queue_exception import ShardQueueException
+from .shard_utils import split_into_shards
+
+
+PENDING = 'pending'
+LEASED = 'leased'
+DONE = 'done'
+FAILED = 'failed'
+
+
+class ShardQueue:
+    """
+    Lease queue of comparison shards stored in a SQLite database.
+
+    The database may live on a filesystem shared by several machines (e.g. next to the contracts directory),
+    as long as the filesystem supports the file locks SQLite relies on.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 600.0, max_attempts: int = 3):
+        """
+        :param path: The path to the database file
+        :param lease_seconds: How long a claimed shard stays reserved for a worker without renewal
+        :param max_attempts: How many times a shard is claimed before it is considered failed
+        """
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+        make_dirs(path)
+        self.connection = sqlite3.connect(path, timeout=60.0, isolation_level=None)
+        self.connection.executescript('''
+            CREATE TABLE IF NOT EXISTS meta (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS shards (
+                id INTEGER PRIMARY KEY,
+                pairs TEXT NOT NULL,
+                status TEXT NOT NULL,
+                worker TEXT,
+                lease_until REAL,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT
+            );
+        ''')
+
+    def __enter__(self) -> 'ShardQueue':
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self.close()
+
+    def create(self, contract_addresses: list[str], block_size: int, settings: dict) -> None:
+        """
+        Fills the queue with the shards of the job. Does nothing if the queue already holds the same job
+        :param contract_addresses: The addresses of the contracts
+        :param block_size: The maximal number of contracts in a block, a shard compares two blocks
+        :param settings: The comparison settings the workers must use
+        :return: None
+        """
+        job = {'addresses': contract_addresses, 'block_size': block_size, 'settings': settings}
+
+        with self._transaction() as cursor:
+            row = cursor.execute("SELECT value FROM meta WHERE key = 'job'").fetchone()
+            if row is not None:
+                if json.loads(row[0]) != job:
+                    raise ShardQueueException(f'Queue {self.path} already holds a different job')
+                return
+
+            cursor.execute("INSERT INTO meta (key, value) VALUES ('job', ?)", (json.dumps(job),))
+            cursor.executemany(
+                'INSERT INTO shards (id, pairs, status) VALUES (?, ?, ?)',
+                [
+                    (shard_id, json.dumps([(i, j, contract_addresses[i], contract_addresses[j]) for (i, j) in pairs]), PENDING)
+                    for shard_id, pairs in enumerate(split_into_shards(contract_addresses, block_size))
+                ],
+            )
+
+    def get_settings(self) -> dict:
+        """
+        Gets the comparison settings of the job, waiting until the job is created
+        :return: The settings
+        """
+        while True:
+            row = self.connection.execute("SELECT value FROM meta WHERE key = 'job'").fetchone()
+            if row is not None:
+                return json.loads(row[0])['settings']
+            time.sleep(1)
+
+    def claim(self, worker: str) -> (int, list[(str, str)]):
+        """
+        Leases the next available shard, which is either pending or has an expired lease
+        :param worker: The id of the worker
+        :return: The shard id and its pairs, or None if there is nothing to claim right now
+        """
+        now = time.time()
+        with self._transaction() as cursor:
+            self._fail_exhausted(cursor, now)
+            row = cursor.execute(
+                'SELECT id, pairs FROM shards WHERE status = ? OR (status = ? AND lease_until < ?) ORDER BY id LIMIT 1',
+                (PENDING, LEASED, now),
+            ).fetchone()
+            if row is None:
+                return None
+
+            cursor.execute(
+                'UPDATE shards SET status = ?, worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?',
+                (LEASED, worker, now + self.lease_seconds, row[0]),
+            )
+            return row[0], [(address_i, address_j) for (_, _, address_i, address_j) in json.loads(row[1])]
+
+    def renew(self, shard_id: int, worker: str) -> bool:
+        """
+        Extends the lease of a shard held by the worker
+        :param shard_id: The id of the shard
+        :param worker: The id of the worker
+        :return: Whether the worker still holds the lease
+        """
+        with self._transaction() as cursor:
+            cursor.execute(
+                'UPDATE shards SET lease_until = ? WHERE id = ? AND worker = ? AND status = ?',
+                (time.time() + self.lease_seconds, shard_id, worker, LEASED),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, shard_id: int, worker: str, result: list[dict]) -> None:
+        """
+        Stores the result of a shard. Shards are deterministic, so the first result wins
+        :param shard_id: The id of the shard
+        :param worker: The id of the worker
+        :param result: The results of Comparer.compare_pair for the pairs of the shard
+        :return: None
+        """
+        with self._transaction() as cursor:
+            cursor.execute(
+                'UPDATE shards SET status = ?, worker = ?, result = ?, error = NULL WHERE id = ? AND status != ?',
+                (DONE, worker, json.dumps(result), shard_id, DONE),
+            )
+
+    def fail(self, shard_id: int, worker: str, error: str) -> None:
+        """
+        Releases a shard after a failure, so it is retried until it runs out of attempts
+        :param shard_id: The id of the shard
+        :param worker: The id of the worker
+        :param error: The description of the failure
+        :return: None
+        """
+        with self._transaction() as cursor:
+            cursor.execute(
+                'UPDATE shards SET status = CASE WHEN attempts < ? THEN ? ELSE ? END, lease_until = NULL, error = ? '
+                'WHERE id = ? AND worker = ? AND status = ?',
+                (self.max_attempts, PENDING, FAILED, error, shard_id, worker, LEASED),
+            )
+
+    def is_created(self) -> bool:
+        return self.connection.execute("SELECT 1 FROM meta WHERE key = 'job'").fetchone() is not None
+
+    def is_finished(self) -> bool:
+        """
+        Checks whether every shard is either done or failed
+        :return: Whether the job is finished
+        """
+        if not self.is_created():
+            return False
+
+        with self._transaction() as cursor:
+            self._fail_exhausted(cursor, time.time())
+            row = cursor.execute(
+                'SELECT COUNT(*) FROM shards WHERE status NOT IN (?, ?)',
+                (DONE, FAILED),
+            ).fetchone()
+        return row[0] == 0
+
+    def get_results(self) -> list[dict]:
+        """
+        Merges the results of the done shards in the order Comparer.compare visits the pairs
+        :return: The results of Comparer.compare_pair
+        """
+        rows = self.connection.execute('SELECT pairs, result FROM shards WHERE status = ?', (DONE,)).fetchall()
+        results = []
+        for (pairs_json, result_json) in rows:
+            for ((i, j, _, _), result) in zip(json.loads(pairs_json), json.loads(result_json)):
+                results.append((i, j, result))
+        results.sort(key=lambda item: item[:2])
+        return [result for (_, _, result) in results]
+
+    def get_failed(self) -> list[(int, str)]:
+        """
+        Gets the shards which ran out of attempts
+        :return: The list of (shard id, error)
+        """
+        return self.connection.execute('SELECT id, error FROM shards WHERE status = ? ORDER BY id', (FAILED,)).fetchall()
+
+    def close(self) -> None:
+        self.connection.close()
+
+    def _fail_exhausted(self, cursor: sqlite3.Cursor, now: float) -> None:
+        cursor.execute(
+            'UPDATE shards SET status = ?, error = COALESCE(error, ?) WHERE status = ? AND lease_until < ? AND attempts >= ?',
+            (FAILED, 'Lease expired', LEASED, now, self.max_attempts),
+        )
+
+    def _transaction(self) -> '_Transaction':
+        return _Transaction(self.connection)
+
+
+class _Transaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self.connection = connection
+
+    def __enter__(self) -> sqlite3.Cursor:
+        self.cursor = self.connection.cursor()
+        self.cursor.execute('BEGIN IMMEDIATE')
+        return self.cursor
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        if exc_type is None:
+            self.cursor.execute('COMMIT')
+        else:
+            self.cursor.execute('ROLLBACK')
+        self.cursor.close()
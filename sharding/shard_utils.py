@@ -0,0 +1,53 @@
+from comparer.diff_utils import print_similar, print_best_matches
+
+
+def get_pairs(contract_addresses: list[str]) -> list[(str, str)]:
+    """
+    Enumerates the contract pairs in the same order as Comparer.compare does
+    :param contract_addresses: The addresses of the contracts
+    :return: The list of address pairs
+    """
+    pairs = []
+    for i in range(1, len(contract_addresses)):
+        for j in range(i):
+            pairs.append((contract_addresses[i], contract_addresses[j]))
+    return pairs
+
+
+def split_into_shards(contract_addresses: list[str], block_size: int) -> list[list[(int, int)]]:
+    """
+    Splits the contract pairs into deterministic shards. The contracts are split into blocks,
+    and a shard holds the pairs of two blocks, so it needs at most 2 * block_size contracts
+    :param contract_addresses: The addresses of the contracts
+    :param block_size: The maximal number of contracts in a block
+    :return: The list of shards, each is a list of (i, j) pairs of contract indices with i > j,
+        in the same order as Comparer.compare visits them
+    """
+    if block_size < 1:
+        raise ValueError('block_size must be positive')
+
+    blocks = [range(start, min(start + block_size, len(contract_addresses)))
+              for start in range(0, len(contract_addresses), block_size)]
+
+    shards = []
+    for bi in range(len(blocks)):
+        for bj in range(bi + 1):
+            shard = [(i, j) for i in blocks[bi] for j in blocks[bj] if i > j]
+            if shard:
+                shards.append(shard)
+    return shards
+
+
+def print_results(results: list[dict]) -> None:
+    """
+    Prints the merged results of the shards in the same format as Comparer.compare does
+    :param results: The results of Comparer.compare_pair
+    :return: None
+    """
+    for result in results:
+        addresses = result['addresses']
+        if 'best_matches' in result:
+            print_best_matches(addresses, result['signatures'], result['best_matches'])
+        else:
+            for (signature0, signature1) in result['similar']:
+                print_similar(addresses, signature0, signature1)
@@ -0,0 +1,172 @@
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from comparer import Comparer
+from .shard_queue import ShardQueue
+
+
+def run_coordinator(
+    queue: ShardQueue,
+    comparer: Comparer,
+    contract_addresses: list[str],
+    block_size: int,
+    poll_interval: float = 1.0,
+) -> list[dict]:
+    """
+    Downloads the missing contracts, fills the queue with the shards of the comparison
+    and waits until the workers finish them
+    :param queue: The shard queue
+    :param comparer: The comparer, which settings the workers use
+    :param contract_addresses: The addresses of the contracts
+    :param block_size: The maximal number of contracts in a block, a shard compares two blocks
+    :param poll_interval: How often to check the queue, in seconds
+    :return: The merged results of the done shards
+    """
+    settings = {
+        'no_operands': comparer.no_operands,
+        'diff_percentage': comparer.diff_percentage,
+        'top_k': comparer.top_k,
+    }
+
+    # download everything up front, so the workers only read the shared contracts directory
+    for address in dict.fromkeys(contract_addresses):
+        comparer.manager.get_abi(address)
+        comparer.manager.get_bytecode(address)
+
+    queue.create(contract_addresses, block_size, settings)
+
+    while not queue.is_finished():
+        time.sleep(poll_interval)
+
+    return queue.get_results()
+
+
+def run_worker(queue: ShardQueue, comparer: Comparer, worker: str = None, poll_interval: float = 1.0) -> int:
+    """
+    Claims and processes shards until the queue is finished
+    :param queue: The shard queue
+    :param comparer: The comparer used to extract functions, its settings are taken from the queue
+    :param worker: The id of the worker, defaults to host name and process id
+    :param poll_interval: How often to check the queue when there is nothing to claim, in seconds
+    :return: The number of shards completed by this worker
+    """
+    if worker is None:
+        worker = f'{socket.gethostname()}-{os.getpid()}'
+
+    settings = queue.get_settings()
+    comparer.no_operands = settings['no_operands']
+    comparer.diff_percentage = settings['diff_percentage']
+    comparer.top_k = settings['top_k']
+
+    # {address -> [{signature, unwrapped_assembly}]}, only for the contracts of the current shard
+    funcs_dict = {}
+    # {(address, function id, no_operands) -> (prepared assembly, Counter)}, likewise
+    prepared = {}
+    completed = 0
+
+    while True:
+        shard = queue.claim(worker)
+        if shard is None:
+            if queue.is_finished():
+                return completed
+            time.sleep(poll_interval)
+            continue
+
+        shard_id, pairs = shard
+
+        # keep the memory bounded by the shard, not by the whole corpus
+        needed = set(address for addresses in pairs for address in addresses)
+        for address in [address for address in funcs_dict if address not in needed]:
+            del funcs_dict[address]
+        for key in [key for key in prepared if key[0] not in needed]:
+            del prepared[key]
+
+        with _LeaseHeartbeat(queue, shard_id, worker) as heartbeat:
+            try:
+                results = _process_shard(comparer, pairs, funcs_dict, prepared, heartbeat)
+            except Exception as e:
+                queue.fail(shard_id, worker, f'{type(e).__name__}: {e}')
+                continue
+
+        if results is None:
+            # the lease was taken over by another worker
+            continue
+
+        queue.complete(shard_id, worker, results)
+        completed += 1
+
+
+def _process_shard(
+    comparer: Comparer,
+    pairs: list[(str, str)],
+    funcs_dict: dict,
+    prepared: dict,
+    heartbeat: '_LeaseHeartbeat',
+) -> list[dict]:
+    results = []
+    for addresses in pairs:
+        for address in addresses:
+            if heartbeat.is_lost():
+                return None
+            if address not in funcs_dict:
+                funcs_dict[address] = comparer.get_functions(address)
+
+        if heartbeat.is_lost():
+            return None
+        f_data = [funcs_dict[addresses[0]], funcs_dict[addresses[1]]]
+        results.append(comparer.compare_pair(list(addresses), f_data, quiet=True, prepared=prepared))
+
+    return None if heartbeat.is_lost() else results
+
+
+class _LeaseHeartbeat:
+    """
+    Renews the lease of a shard from a background thread while the shard is processed
+    """
+
+    def __init__(self, queue: ShardQueue, shard_id: int, worker: str):
+        self.queue = queue
+        self.shard_id = shard_id
+        self.worker = worker
+        self._stopped = threading.Event()
+        self._lost = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def __enter__(self) -> '_LeaseHeartbeat':
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._stopped.set()
+        self._thread.join()
+
+    def is_lost(self) -> bool:
+        return self._lost.is_set()
+
+    def _run(self) -> None:
+        # SQLite connections can't be shared between threads, so the heartbeat uses its own
+        queue = None
+        renewed_at = time.time()
+        try:
+            while not self._stopped.wait(self.queue.lease_seconds / 3):
+                try:
+                    if queue is None:
+                        queue = ShardQueue(self.queue.path, self.queue.lease_seconds, self.queue.max_attempts)
+                    renewed = queue.renew(self.shard_id, self.worker)
+                except (sqlite3.Error, OSError):
+                    # the database is busy or unreachable, retry on the next beat until the lease runs out
+                    if time.time() - renewed_at >= self.queue.lease_seconds:
+                        self._lost.set()
+                        return
+                    continue
+
+                if not renewed:
+                    self._lost.set()
+                    return
+                renewed_at = time.time()
+        finally:
+            if queue is not None:
+                queue.close()
@@ -0,0 +1,126 @@
+import json
+import multiprocessing
+import random
+import sqlite3
+import threading
+
+import pytest
+from pyevmasm import disassemble_all
+
+from comparer import Comparer
+from sharding import ShardQueue, get_pairs, run_coordinator, run_worker, split_into_shards
+
+
+OPCODES = bytes([0x01, 0x02, 0x50, 0x80, 0x90, 0x5b])
+FAILING_ADDRESS = '0xbad'
+LEASE_SECONDS = 5.0
+WORKERS = 3
+TIMEOUT = 120
+
+
+class FakeManager:
+    def get_abi(self, address: str) -> list:
+        return []
+
+    def get_bytecode(self, address: str) -> bytes:
+        return b''
+
+
+class FakeComparer(Comparer):
+    def get_functions(self, address: str) -> list[dict]:
+        if address == FAILING_ADDRESS:
+            raise RuntimeError(f'Unable to extract {address}')
+
+        # contracts of the same family share a part of their functions
+        family = random.Random(int(address, 16) % 3)
+        own = random.Random(address)
+        funcs = []
+        for i in range(4):
+            rnd = family if i < 2 else own
+            bytecode = bytes(rnd.choice(OPCODES) for _ in range(rnd.randint(10, 40)))
+            funcs.append({'signature': f'f{i}()', 'unwrapped_assembly': list(disassemble_all(bytecode))})
+        return funcs
+
+
+def _work(path: str, max_attempts: int) -> None:
+    with ShardQueue(path, LEASE_SECONDS, max_attempts) as queue:
+        run_worker(queue, FakeComparer(None), poll_interval=0.05)
+
+
+def _run(path: str, addresses: list[str], block_size: int, top_k: int, max_attempts: int) -> list[dict]:
+    workers = [multiprocessing.Process(target=_work, args=(path, max_attempts)) for _ in range(WORKERS)]
+    for worker in workers:
+        worker.start()
+
+    results = []
+
+    def coordinate():
+        with ShardQueue(path, LEASE_SECONDS, max_attempts) as queue:
+            results.extend(run_coordinator(queue, FakeComparer(FakeManager(), top_k=top_k), addresses, block_size, 0.05))
+
+    coordinator = threading.Thread(target=coordinate, daemon=True)
+    coordinator.start()
+    coordinator.join(TIMEOUT)
+    for worker in workers:
+        worker.join(TIMEOUT)
+
+    assert not coordinator.is_alive()
+    assert all(worker.exitcode == 0 for worker in workers)
+    return results
+
+
+def _expected(addresses: list[str], top_k: int) -> list[dict]:
+    comparer = FakeComparer(None, top_k=top_k)
+    expected = []
+    for (address0, address1) in get_pairs(addresses):
+        if FAILING_ADDRESS in (address0, address1):
+            continue
+        f_data = [comparer.get_functions(address0), comparer.get_functions(address1)]
+        expected.append(comparer.compare_pair([address0, address1], f_data, quiet=True))
+    # results pass through JSON in the queue
+    return json.loads(json.dumps(expected))
+
+
+@pytest.mark.parametrize('top_k', [0, 2])
+def test_workers_results_match_single_process(tmp_path, top_k):
+    addresses = [hex(0x1000 + i) for i in range(11)]
+
+    results = _run(str(tmp_path / 'queue.sqlite'), addresses, 3, top_k, 3)
+
+    assert results == _expected(addresses, top_k)
+    with ShardQueue(str(tmp_path / 'queue.sqlite')) as queue:
+        assert queue.get_failed() == []
+
+
+def test_failing_shards_are_retried_and_reported(tmp_path):
+    addresses = [hex(0x1000 + i) for i in range(5)] + [FAILING_ADDRESS] + [hex(0x2000 + i) for i in range(4)]
+    block_size = 2
+    max_attempts = 2
+    path = str(tmp_path / 'queue.sqlite')
+
+    results = _run(path, addresses, block_size, 0, max_attempts)
+
+    failing_index = addresses.index(FAILING_ADDRESS)
+    failing_shards = [
+        shard_id for shard_id, pairs in enumerate(split_into_shards(addresses, block_size))
+        if any(failing_index in pair for pair in pairs)
+    ]
+    with ShardQueue(path) as queue:
+        failed = queue.get_failed()
+    assert [shard_id for (shard_id, _) in failed] == failing_shards
+    assert all(error == f'RuntimeError: Unable to extract {FAILING_ADDRESS}' for (_, error) in failed)
+
+    with sqlite3.connect(path) as connection:
+        attempts = connection.execute(
+            f'SELECT attempts FROM shards WHERE id IN ({",".join("?" * len(failing_shards))})',
+            failing_shards,
+        ).fetchall()
+    assert all(count == max_attempts for (count,) in attempts)
+
+    # the other shards are merged as usual
+    failing_pairs = set(
+        (addresses[i], addresses[j]) for shard_id in failing_shards
+        for (i, j) in split_into_shards(addresses, block_size)[shard_id]
+    )
+    expected = [result for result in _expected(addresses, 0) if tuple(result['addresses']) not in failing_pairs]
+    assert results == expected
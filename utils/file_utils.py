@@ -1,4 +1,5 @@
 import os
+import uuid
 from typing import IO
 
 
@@ -13,13 +14,31 @@ def read_binary(path: str) -> bytes:
 
 
 def write_text(path: str, content: str) -> None:
-    with make_dirs_and_open(path, 'w', newline='') as f:
-        f.write(content)
+    write_atomically(path, content, 'w', newline='')
 
 
 def write_binary(path: str, content: bytes) -> None:
-    with make_dirs_and_open(path, 'wb') as f:
-        f.write(content)
+    write_atomically(path, content, 'wb')
+
+
+def write_atomically(path: str, content, mode: str, **kwargs) -> None:
+    """
+    Writes the content to a temporary file and moves it to the given path,
+    so concurrent readers, possibly on other machines, never see a partially written file
+    :param path: The path to the file
+    :param content: The content to write
+    :param mode: The mode to open the file
+    :return: None
+    """
+    tmp_path = f'{path}.{os.getpid()}.{uuid.uuid4().hex}.tmp'
+    try:
+        with make_dirs_and_open(tmp_path, mode, **kwargs) as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
 
 
 def make_dirs_and_open(path: str, mode: str, **kwargs) -> IO:
@@ -29,7 +48,16 @@ def make_dirs_and_open(path: str, mode: str, **kwargs) -> IO:
     :param mode: The mode to open the file
     :return: The opened file
     """
-    output_dir = os.path.dirname(path)
-    if output_dir and not os.path.exists(output_dir):
-        os.makedirs(output_dir)
+    make_dirs(path)
     return open(path, mode, **kwargs)
+
+
+def make_dirs(path: str) -> None:
+    """
+    Creates the directory for the given path
+    :param path: The path to the file
+    :return: None
+    """
+    output_dir = os.path.dirname(path)
+    if output_dir:
+        os.makedirs(output_dir, exist_ok=True)